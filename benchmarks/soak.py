@@ -0,0 +1,204 @@
+"""
+  Memory soak benchmark
+
+  Runs the collector's fetch, parse and write cycle against a local stand-in
+  SB8200 web interface and a stand-in InfluxDB write endpoint, sampling RSS and
+  tracemalloc as it goes. Exits 1 if memory keeps growing after warmup.
+
+  python3 benchmarks/soak.py --cycles 200000
+"""
+# pylint: disable=line-too-long
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import tracemalloc
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import memory_trace
+
+def main():
+  """ MAIN """
+  args = get_args()
+  logging.basicConfig(level=logging.ERROR, format='%(asctime)s %(levelname)-8s %(message)s')
+
+  # __main__.py can't be imported by name from here
+  spec = importlib.util.spec_from_file_location('collector', os.path.join(SRC, '__main__.py'))
+  collector = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(collector)
+
+  modem_server = start_server(ModemHandler)
+  influx_server = start_server(InfluxHandler)
+
+  overrides = {
+    'modem_ip': '127.0.0.1:%s' % modem_server.server_port,
+    'modem_model': 'sb8200',
+    'exit_on_auth_error': False,
+    'exit_on_html_error': False,
+    'anomaly_detection': True,
+    'influx_url': 'http://127.0.0.1:%s' % influx_server.server_port,
+    'influx_org': 'soak',
+    'influx_token': 'soak',
+  }
+  config = collector.get_config(None)
+  config.update(overrides)
+  modem_config = dict(next(iter(config['modems'].values())), **overrides)
+
+  modem = collector.init_modem('soak', modem_config)
+  writer = collector.init_writer(config)
+
+  tracemalloc.start()
+  _, rss_kind = memory_trace.get_rss()
+  if rss_kind != 'RSS':
+    print('Current RSS not available on this platform, comparing %s instead' % rss_kind)
+  samples = []
+  started = time.monotonic()
+  for cycle in range(1, args.cycles + 1):
+    collector.poll_modem(modem, writer)
+
+    if cycle % args.sample_every == 0:
+      traced, _ = tracemalloc.get_traced_memory()
+      samples.append((cycle, memory_trace.get_rss()[0], traced))
+      print('cycle %8d  %6.0f cycles/s  %s %7.1f MiB  traced %7.1f MiB' % (
+        cycle, cycle / (time.monotonic() - started), rss_kind, samples[-1][1] / 2**20, traced / 2**20))
+      sys.stdout.flush()
+
+  collector.close_writer(writer)
+  modem_server.shutdown()
+  influx_server.shutdown()
+
+  # Compare the average of the first and last third of the samples taken after warmup
+  samples = [sample for sample in samples if sample[0] > args.warmup]
+  if len(samples) < 3:
+    print('Not enough samples after warmup, increase --cycles')
+    sys.exit(1)
+
+  third = len(samples) // 3
+  rss_growth = average(samples[-third:], 1) - average(samples[:third], 1)
+  traced_growth = average(samples[-third:], 2) - average(samples[:third], 2)
+  print('Growth after warmup: %s %.2f MiB, traced %.1f KiB' % (rss_kind, rss_growth / 2**20, traced_growth / 2**10))
+
+  failed = False
+  if traced_growth > args.max_traced_growth * 2**10:
+    print('FAIL: traced memory grew more than %s KiB' % args.max_traced_growth)
+    failed = True
+  if rss_growth > args.max_rss_growth * 2**20:
+    print('FAIL: %s grew more than %s MiB' % (rss_kind, args.max_rss_growth))
+    failed = True
+
+  if failed:
+    snapshot = tracemalloc.take_snapshot()
+    for stat in snapshot.statistics('lineno')[:10]:
+      print(stat)
+    sys.exit(1)
+
+  print('PASS')
+
+def get_args():
+  """ Get argparser args """
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--cycles', type=int, default=200000, help='Fetch, parse and write cycles to run')
+  parser.add_argument('--warmup', type=int, default=5000, help='Cycles to ignore while caches fill up')
+  parser.add_argument('--sample-every', type=int, default=1000, help='Cycles between memory samples')
+  parser.add_argument('--max-traced-growth', type=float, default=512, help='Allowed tracemalloc growth in KiB')
+  parser.add_argument('--max-rss-growth', type=float, default=16, help='Allowed RSS growth in MiB')
+  return parser.parse_args()
+
+def average(samples, index):
+  """ Average one column of the samples """
+  return sum(sample[index] for sample in samples) / len(samples)
+
+def start_server(handler):
+  """ Start a local HTTP server on a free port in a background thread """
+  server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+class ModemHandler(BaseHTTPRequestHandler):
+  """ Stand-in SB8200 pages, codeword counters grow every request """
+  protocol_version = 'HTTP/1.1'
+  # Buffer the response so headers and body go out in one write, avoiding Nagle delays
+  wbufsize = -1
+  requests_served = 0
+
+  def do_GET(self):
+    ModemHandler.requests_served += 1
+    if self.path.startswith('/cmswinfo.html'):
+      body = get_sb8200_swinfo_html(ModemHandler.requests_served).encode('utf-8')
+    else:
+      body = get_sb8200_html(ModemHandler.requests_served).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/html')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+class InfluxHandler(BaseHTTPRequestHandler):
+  """ Stand-in InfluxDB 2.x write endpoint """
+  protocol_version = 'HTTP/1.1'
+  wbufsize = -1
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    self.send_response(204)
+    self.send_header('Content-Length', '0')
+    self.end_headers()
+
+  def log_message(self, format, *args):
+    pass
+
+def get_sb8200_html(counter):
+  """ Build a status page shaped like the SB8200's, including its extra </tr> bug """
+  downstream = ''.join(
+    "<tr align='left'><td>%s</td><td>Locked</td><td>%s</td><td>%s Hz</td><td>%.1f dBmV</td><td>%.1f dB</td><td>%s</td><td>%s</td></tr>\n" % (
+      channel, 'Other' if channel == 33 else 'QAM256', 435000000 + channel * 6000000,
+      3 + (counter + channel) % 5 / 10, 40 + (counter * channel) % 7 / 10, counter * channel, counter // 100)
+    for channel in range(1, 34)
+  )
+  upstream = ''.join(
+    "<tr align='left'><td>%s</td><td>%s</td><td>Locked</td><td>SC-QAM Upstream</td><td>%s Hz</td><td>6400000 Hz</td><td>%.1f dBmV</td></tr>\n" % (
+      channel, channel, 16400000 + channel * 6400000, 44 + counter % 3 / 10)
+    for channel in range(1, 5)
+  )
+  return (
+    "<html><body>\n"
+    "<table class='simpleTable'><tr><th colspan=3><strong>Startup Procedure</strong></th></tr>\n"
+    "<tr><td>Acquire Downstream Channel</td><td>%s Hz</td><td>Locked</td></tr></table>\n"
+    "<table class='simpleTable'><tr><th colspan=8><strong>Downstream Bonded Channels</strong></th></tr>\n"
+    "<td><strong>Channel ID</strong></td><td><strong>Lock Status</strong></td><td><strong>Modulation</strong></td>"
+    "<td><strong>Frequency</strong></td><td><strong>Power</strong></td><td><strong>SNR/MER</strong></td>"
+    "<td><strong>Corrected</strong></td><td><strong>Uncorrectables</strong></td></tr>\n"
+    "%s</table>\n"
+    "<table class='simpleTable'><tr><th colspan=7><strong>Upstream Bonded Channels</strong></th></tr>\n"
+    "<td><strong>Channel</strong></td><td><strong>Channel ID</strong></td><td><strong>Lock Status</strong></td>"
+    "<td><strong>US Channel Type</strong></td><td><strong>Frequency</strong></td><td><strong>Width</strong></td>"
+    "<td><strong>Power</strong></td></tr>\n"
+    "%s</table>\n"
+    "</body></html>\n"
+  ) % (441000000, downstream, upstream)
+
+def get_sb8200_swinfo_html(counter):
+  """ Build a software info page shaped like the SB8200's """
+  return (
+    "<html><body>\n"
+    "<table class='simpleTable'><tr><th colspan=2><strong>Information</strong></th></tr>\n"
+    "<tr><td>Hardware Version</td><td>6</td></tr>\n"
+    "<tr><td>Software Version</td><td>AB01.02.053.05_051921_193.0A.NSH</td></tr></table>\n"
+    "<table class='simpleTable'><tr><th colspan=2><strong>Status</strong></th></tr>\n"
+    "<tr><td>Up Time</td><td>%s days %02dh:%02dm:%02ds.00</td></tr></table>\n"
+    "</body></html>\n"
+  ) % (counter // 86400, counter // 3600 % 24, counter // 60 % 60, counter % 60)
+
+if __name__ == '__main__':
+  main()
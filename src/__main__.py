@@ -9,11 +9,31 @@
 import os
 import sys
 import time
+import atexit
+import subprocess
 import logging
+import signal
 import argparse
 import configparser
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, UTC
 import urllib3
+import counter_rates
+import anomaly_detection
+import series_cardinality
+import memory_trace
+import capture
+import sharding
+import circuit_breaker
+import cycle_deadline
+
+# Set by SIGHUP or a config file change, checked once per interval
+RELOAD = { 'requested': False }
+
+# Supported values of modem_model and destination
+MODEM_MODELS = ('sb8200', 's33', 'xb8')
+DESTINATIONS = ('influxdb',)
 
 def main():
   """ MAIN """
@@ -27,77 +47,432 @@ def main():
   if config['enable_debug']:
     init_logger(True)
 
-  sleep_interval = int(config['sleep_interval'])
-  destination = config['destination']
-  modem_model = config['modem_model']
+  if args.replay:
+    replay(config, capture.find_segments(args.replay), args.replay_workers, args.replay_batch_size)
+    return
 
-  if modem_model == 'sb8200':
-    import arris_stats_sb8200
-    get_credential = arris_stats_sb8200.get_credential
-    get_data = arris_stats_sb8200.get_html
-    parse_data = arris_stats_sb8200.parse_html
-  elif modem_model == 's33':
-    import arris_stats_s33
-    get_credential = arris_stats_s33.get_credential
-    get_data = arris_stats_s33.get_json
-    parse_data = arris_stats_s33.parse_json
-  elif modem_model == 'xb8':
-    import comcast_xb8_stats
-    get_credential = comcast_xb8_stats.get_credential
-    get_data = comcast_xb8_stats.get_html
-    parse_data = comcast_xb8_stats.parse_html
-  else:
-    error_exit('Modem model %s not supported!  Aborting', sleep=False)
+  if args.processes is not None:
+    launch_shards(args, args.processes or multiprocessing.cpu_count())
+    return
 
-  # Disable the SSL warnings if we're not verifying SSL
-  if not config['modem_verify_ssl']:
-    urllib3.disable_warnings()
+  if config['shard_index'] >= config['shard_count'] and not config['shard_lock_dir']:
+    error_exit('shard_index %s must be less than shard_count %s!  Aborting.' % (config['shard_index'], config['shard_count']), sleep=False)
 
-  credential = None
+  modems = {}
+  for name, modem_config in config['modems'].items():
+    modems[name] = init_modem(name, modem_config)
+
+  writer = init_writer(config)
+
+  # SIGHUP re-reads the config file before the next interval
+  if hasattr(signal, 'SIGHUP'):
+    signal.signal(signal.SIGHUP, request_reload)
+  config_mtime = get_config_mtime(config_path)
+
+  memory_state = {}
+  shard_state = {}
+  atexit.register(lambda: sharding.leave(shard_state, config))
+  # SIGTERM (docker stop, launch_shards) would otherwise skip the atexit handlers
+  signal.signal(signal.SIGTERM, request_exit)
 
   first = True
   while True:
     if not first:
-      logging.info('Sleeping for %s seconds', sleep_interval)
+      logging.info('Sleeping for %s seconds', config['sleep_interval'])
       sys.stdout.flush()
-      time.sleep(sleep_interval)
+      time.sleep(config['sleep_interval'])
     first = False
 
-    if config['modem_auth_required'] or modem_model == 's33' or modem_model == 'xb8':
-      while not credential:
-        credential = get_credential(config)
-        if not credential and config['exit_on_auth_error']:
-          error_exit('Unable to authenticate with modem. Exiting since exit_on_auth_error is True.', config)
-        if not credential:
-          logging.info('Unable to obtain valid login session, sleeping for: %ss', sleep_interval)
-          time.sleep(sleep_interval)
-          continue
-
-    # Get the HTML from the modem
-    data = get_data(config, credential)
-    if not data:
-      if config['exit_on_html_error']:
-        error_exit('No data obtained from modem. Exiting since exit_on_html_error is True.', config)
-      
-      logging.error('No data to parse, giving up until next interval.')
-      if config['clear_auth_token_on_html_error']:
-        logging.info('clear_auth_token_on_html_error is true, clearing credential token.')
-        credential = None
+    if config['config_reload_on_change']:
+      mtime = get_config_mtime(config_path)
+      if mtime != config_mtime:
+        logging.info('Config file %s changed on disk', config_path)
+        config_mtime = mtime
+        RELOAD['requested'] = True
+
+    if RELOAD['requested']:
+      RELOAD['requested'] = False
+      config, modems, writer = reload_config(config_path, config, modems, writer)
+
+    for modem in sharding.select_modems(shard_state, config, modems).values():
+      sharding.heartbeat(shard_state, config)
+      poll_modem(modem, writer)
+
+    if config['memory_trace_interval']:
+      memory_trace.log_top_allocations(memory_state, config)
+    elif memory_state:
+      memory_trace.stop(memory_state)
+
+
+def init_modem(name, config):
+  """ Build the running state for a single modem """
+  driver = get_driver(config['modem_model'])
+
+  # Disable the SSL warnings if we're not verifying SSL
+  if not config['modem_verify_ssl']:
+    urllib3.disable_warnings()
+
+  return {
+    'name': name,
+    'config': config,
+    'driver': driver,
+    'credential': None,
+    'page_times': {},
+    'counter_state': {},
+    'anomaly_state': {},
+    'series_state': {},
+    'capture_state': {},
+    'breaker': circuit_breaker.new(),
+    'cycle_stats': {'cycles': 0, 'overruns': 0},
+  }
+
+
+def get_driver(modem_model):
+  """ Return the module for a modem model, providing get_credential, get_page and PAGES """
+  if modem_model == 'sb8200':
+    import arris_stats_sb8200
+    return arris_stats_sb8200
+  if modem_model == 's33':
+    import arris_stats_s33
+    return arris_stats_s33
+  if modem_model == 'xb8':
+    import comcast_xb8_stats
+    return comcast_xb8_stats
+
+  error_exit('Modem model %s not supported!  Aborting' % modem_model, sleep=False)
+
+
+def poll_modem(modem, writer):
+  """ Run one fetch, parse and send cycle for a modem, unless its circuit is open """
+  config = modem['config']
+  breaker = modem['breaker']
+  now = time.time()
+  current_time = datetime.now(UTC).replace(microsecond=0)
+
+  if circuit_breaker.allow(breaker, now):
+    started = time.monotonic()
+    cycle_config = cycle_deadline.start(config)
+    records = collect_modem(modem, cycle_config, current_time)
+
+    if records is None:
+      circuit_breaker.failure(breaker, config, now)
+      records = []
+    else:
+      circuit_breaker.success(breaker)
+
+    modem['cycle_stats']['cycles'] += 1
+    records.append(get_cycle_record(modem, config, time.monotonic() - started, current_time))
+  else:
+    logging.info('Circuit open for modem %s, skipping for another %.0fs', modem['name'], breaker['retry_at'] - now)
+    records = []
+
+  records.append(circuit_breaker.get_record(breaker, config, now, current_time))
+  send_to_influx(records, writer)
+
+
+def get_cycle_record(modem, config, duration, current_time):
+  """ Build the InfluxDB record reporting how long the poll took """
+  record = {
+    'measurement': 'modem_cycle',
+    'time': current_time,
+    'fields': {
+      'duration': float(duration),
+      'cycles': modem['cycle_stats']['cycles'],
+      'overruns': modem['cycle_stats']['overruns'],
+    },
+    'tags': {}
+  }
+  if config['modem_name']:
+    record['tags']['modem'] = config['modem_name']
+
+  return record
+
+
+def collect_modem(modem, config, current_time):
+  """ Fetch and parse the modem's stats, returns the records to write or None on failure """
+  modem_model = config['modem_model']
+
+  if config['modem_auth_required'] or modem_model == 's33' or modem_model == 'xb8':
+    if not modem['credential']:
+      modem['credential'] = modem['driver'].get_credential(config)
+      if not modem['credential'] and config['exit_on_auth_error']:
+        error_exit('Unable to authenticate with modem. Exiting since exit_on_auth_error is True.', config)
+      if not modem['credential'] and cycle_deadline.expired(config):
+        return abandon_cycle(modem, config)
+      if not modem['credential']:
+        logging.info('Unable to obtain valid login session, giving up until next interval.')
+        return None
+
+  # Get the HTML from the modem, the first page has the channel stats
+  pages = fetch_pages(modem, config)
+  main_page = next(iter(modem['driver'].PAGES))
+  data = pages.pop(main_page)
+  if not data and cycle_deadline.expired(config):
+    return abandon_cycle(modem, config)
+  if not data:
+    if config['exit_on_html_error']:
+      error_exit('No data obtained from modem. Exiting since exit_on_html_error is True.', config)
+
+    logging.error('No data to parse, giving up until next interval.')
+    if config['clear_auth_token_on_html_error']:
+      logging.info('clear_auth_token_on_html_error is true, clearing credential token.')
+      modem['credential'] = None
+    return None
+
+  if config['capture_dir']:
+    capture.write(modem['capture_state'], config, modem['name'], main_page, data)
+
+  # Parse the HTML to get our stats
+  try:
+    stats = modem['driver'].PAGES[main_page]['parse'](data)
+  except Exception:
+    logging.exception('Failed to parse %s, giving up until next interval', main_page)
+    return None
+
+  if not stats or (not stats['upstream'] and not stats['downstream']):
+    logging.error(
+      'Failed to get any stats, giving up until next interval')
+    return None
+
+  # Other pages are optional, a failed one is simply tried again next interval
+  for page, page_data in pages.items():
+    if not page_data:
+      continue
+    if config['capture_dir']:
+      capture.write(modem['capture_state'], config, modem['name'], page, page_data)
+    try:
+      stats.update(modem['driver'].PAGES[page]['parse'](page_data))
+    except Exception:
+      logging.exception('Failed to parse %s', page)
       continue
+    modem['page_times'][page] = time.monotonic()
+
+  if cycle_deadline.expired(config):
+    return abandon_cycle(modem, config)
+
+  try:
+    counter_rates.update(modem['counter_state'], stats, time.time())
+
+    anomalies = []
+    if config['anomaly_detection']:
+      anomalies = anomaly_detection.update(modem['anomaly_state'], stats, config)
+
+    records = get_influx_records(stats, config, current_time, anomalies)
+    return series_cardinality.limit(modem['series_state'], records, config, current_time)
+  except Exception:
+    logging.exception('Failed to build records from the modem stats, giving up until next interval')
+    return None
+
+
+def abandon_cycle(modem, config):
+  """ Give up on a poll that went past its cycle deadline """
+  logging.error('Modem %s took longer than cycle_deadline of %ss, abandoning this interval', modem['name'], config['cycle_deadline'])
+  modem['cycle_stats']['overruns'] += 1
+  return None
+
+
+def fetch_pages(modem, config):
+  """ Fetch the modem pages that are due this interval, concurrently
+    using the same login session. Returns the raw data for each page,
+    None where fetching failed.
+  """
+  now = time.monotonic()
+  due = [
+    page for page, spec in modem['driver'].PAGES.items()
+    if not spec['interval'] or page not in modem['page_times'] or now - modem['page_times'][page] >= spec['interval']
+  ]
 
-    # Parse the HTML to get our stats
-    stats = parse_data(data)
+  get_page = modem['driver'].get_page
+  if len(due) == 1:
+    return { due[0]: get_page(config, modem['credential'], due[0]) }
 
-    if not stats or (not stats['upstream'] and not stats['downstream']):
-      logging.error(
-        'Failed to get any stats, giving up until next interval')
+  with ThreadPoolExecutor(max_workers=len(due)) as executor:
+    futures = { page: executor.submit(get_page, config, modem['credential'], page) for page in due }
+    return { page: future.result() for page, future in futures.items() }
+
+
+def launch_shards(args, processes):
+  """ Run one collector process per shard on this host,
+    exit as soon as any of them does
+  """
+  logging.info('Launching %s collector processes', processes)
+
+  children = []
+  for index in range(processes):
+    # Shards are assigned through the same ENV overrides as any other setting
+    env = dict(os.environ, shard_index=str(index), shard_count=str(processes))
+    command = [sys.executable, sys.argv[0], '--config', args.config]
+    if args.debug:
+      command.append('--debug')
+    children.append(subprocess.Popen(command, env=env))
+
+  # Pass reloads and shutdowns on to the children
+  def forward(signum, frame):
+    for child in children:
+      child.send_signal(signum)
+  for signum in ('SIGHUP', 'SIGTERM', 'SIGINT'):
+    if hasattr(signal, signum):
+      signal.signal(getattr(signal, signum), forward)
+
+  while True:
+    for child in children:
+      returncode = child.poll()
+      if returncode is not None:
+        logging.error('Collector process %s exited with %s, stopping the others', child.pid, returncode)
+        for other in children:
+          if other.poll() is None:
+            other.terminate()
+        for other in children:
+          other.wait()
+        sys.exit(returncode or 1)
+    time.sleep(1)
+
+def replay(config, segments, workers, batch_size):
+  """ Stream captured responses through the current parser and writer,
+    one segment per worker process, keeping the original timestamps
+  """
+  if not segments:
+    error_exit('No capture segments found to replay', sleep=False)
+
+  # The workers run replay_segment from this __main__.py, which spawned or
+  # forkserver workers can't import, they have to be forked
+  if 'fork' not in multiprocessing.get_all_start_methods():
+    error_exit('Replay needs the fork start method, which this platform does not have', sleep=False)
+
+  logging.info('Replaying %s capture segments with %s workers', len(segments), workers or multiprocessing.cpu_count())
+  started = time.monotonic()
+
+  tasks = [(config, segment, batch_size) for segment in segments]
+  responses = points = failed = 0
+  with multiprocessing.get_context('fork').Pool(workers) as pool:
+    for segment, segment_responses, segment_points, segment_failed in pool.imap_unordered(replay_segment, tasks):
+      logging.info('Replayed %s: %s responses, %s points, %s failed', segment, segment_responses, segment_points, segment_failed)
+      responses += segment_responses
+      points += segment_points
+      failed += segment_failed
+
+  elapsed = time.monotonic() - started
+  logging.info('Replayed %s responses as %s points in %.1fs (%.0f points/s), %s failed',
+    responses, points, elapsed, points / elapsed if elapsed else 0, failed)
+
+def replay_segment(task):
+  """ Replay one capture segment, runs in a worker process """
+  config, segment, batch_size = task
+  writer = init_writer(config)
+  counter_states = {}
+  batch = []
+  responses = points = failed = 0
+
+  # Parsers log at INFO for every response, far too chatty at replay speed
+  logging.getLogger().setLevel(max(logging.getLogger().level, logging.WARNING))
+
+  for record in capture.read_segment(segment):
+    responses += 1
+    try:
+      pages = get_driver(record['model']).PAGES
+      # Captures from before pages were recorded only hold the channel stats page
+      stats = pages[record.get('page') or next(iter(pages))]['parse'](record['data'])
+      counter_rates.update(counter_states.setdefault(record['modem'], {}), stats, record['time'])
+      current_time = datetime.fromtimestamp(int(record['time']), UTC)
+      records = get_influx_records(stats, {'modem_name': record['modem']}, current_time)
+      batch.extend(series_cardinality.move_tags_to_fields(records, config))
+    except Exception:
+      logging.exception('Failed to replay a response from %s', segment)
+      failed += 1
       continue
 
-    # Where should 6we send the results?
-    if destination == 'influxdb':
-      send_to_influx(stats, config)
+    if len(batch) >= batch_size:
+      points += write_batch(batch, writer)
+      batch = []
+
+  if batch:
+    points += write_batch(batch, writer)
+  close_writer(writer)
+
+  return segment, responses, points, failed
+
+def write_batch(records, writer):
+  """ Write a batch of replayed records, returns the number of points written """
+  from influxdb_client import Point
+
+  try:
+    writer['write_api'].write(bucket = writer['config']['influx_bucket'], record = [Point.from_dict(record) for record in records])
+  except Exception:
+    logging.exception('Failed To Write To InfluxDB')
+    return 0
+
+  return len(records)
+
+def request_reload(signum, frame):
+  """ Signal handler, flag the config for reloading before the next interval """
+  RELOAD['requested'] = True
+
+def request_exit(signum, frame):
+  """ Signal handler, exit cleanly so the atexit handlers run """
+  logging.info('Received signal %s, exiting', signum)
+  sys.exit(0)
+
+def get_config_mtime(config_path):
+  """ Return the config file modification time, or None if it can't be read """
+  try:
+    return os.stat(config_path).st_mtime
+  except (OSError, TypeError):
+    return None
+
+def reload_config(config_path, config, modems, writer):
+  """ Re-read the config and rebuild only the parts that changed.
+    Modems with an unchanged config keep their login credential,
+    and the writer keeps its client if no destination settings changed.
+  """
+  logging.info('Reloading config from %s', config_path)
+
+  try:
+    new_config = get_config(config_path)
+  except Exception:
+    logging.exception('Failed to reload config, keeping the running config')
+    return config, modems, writer
+
+  # Check everything up front, startup would exit on these but a reload shouldn't
+  for name, modem_config in new_config['modems'].items():
+    if modem_config['modem_model'] not in MODEM_MODELS:
+      logging.error('Modem model %s of modem %s not supported, keeping the running config', modem_config['modem_model'], name)
+      return config, modems, writer
+  if new_config['destination'] not in DESTINATIONS:
+    logging.error('Destination %s not supported, keeping the running config', new_config['destination'])
+    return config, modems, writer
+
+  new_writer = writer
+  if get_writer_config(new_config) != get_writer_config(config):
+    logging.info('Destination config changed, rebuilding writer')
+    try:
+      new_writer = init_writer(new_config)
+    except Exception:
+      logging.exception('Failed to create the destination client, keeping the running config')
+      return config, modems, writer
+
+  if new_config['enable_debug'] != config['enable_debug']:
+    init_logger(new_config['enable_debug'])
+
+  new_modems = {}
+  for name, modem_config in new_config['modems'].items():
+    modem = modems.get(name)
+    if modem and get_session_config(modem['config']) == get_session_config(modem_config):
+      modem['config'] = modem_config
+      new_modems[name] = modem
     else:
-      error_exit('Destination %s not supported!  Aborting.' % destination, sleep=False)
+      logging.info('Modem %s %s', name, 'changed, starting new session' if modem else 'added')
+      new_modems[name] = init_modem(name, modem_config)
+
+  for name, modem in modems.items():
+    if new_modems.get(name) is not modem:
+      capture.close(modem['capture_state'])
+    if name not in new_modems:
+      logging.info('Modem %s removed', name)
+
+  if new_writer is not writer:
+    close_writer(writer)
+
+  return new_config, new_modems, new_writer
 
 
 def get_args():
@@ -105,6 +480,10 @@ def get_args():
   parser = argparse.ArgumentParser()
   parser.add_argument('--config', metavar='config_file_path', help='Path to config file', required=True)
   parser.add_argument('--debug', help='Enable debug logging', action='store_true', required=False, default=False)
+  parser.add_argument('--processes', type=int, help='Run this many collector processes, each owning a shard of the modems, 0 for one per CPU', required=False, default=None)
+  parser.add_argument('--replay', metavar='capture_path', nargs='+', help='Replay captured modem responses from these segment files or directories, then exit', required=False)
+  parser.add_argument('--replay-workers', type=int, help='Processes to replay with, defaults to one per CPU', required=False, default=None)
+  parser.add_argument('--replay-batch-size', type=int, help='Points per write when replaying', required=False, default=5000)
   args = parser.parse_args()
   return args
 
@@ -128,6 +507,35 @@ def get_config(config_path=None):
     'clear_auth_token_on_html_error': True,
     'sleep_before_exit': True,
     'request_timeout': 30,
+    'request_connect_timeout': 5,
+    'cycle_deadline': 60,
+    'config_reload_on_change': False,
+
+    # Anomaly detection
+    'anomaly_detection': False,
+    'anomaly_alpha': 0.1,
+    'anomaly_threshold': 4.0,
+    'anomaly_warmup': 10,
+
+    # Memory tracing
+    'memory_trace_interval': 0,
+    'memory_trace_top': 10,
+
+    # Raw response capture
+    'capture_dir': None,
+    'capture_rotate_seconds': 3600,
+    'capture_max_segments': 0,
+
+    # Sharding
+    'shard_index': 0,
+    'shard_count': 1,
+    'shard_lock_dir': None,
+    'shard_heartbeat_timeout': 0,
+
+    # Circuit breaker
+    'breaker_failure_threshold': 3,
+    'breaker_backoff_base': 240,
+    'breaker_backoff_max': 3600,
 
     # SB8200 Only
     'modem_ssl': False,
@@ -140,9 +548,12 @@ def get_config(config_path=None):
     'influx_org': None,
     'influx_token': None,
     'influx_verify_ssl': True,
+    'influx_tags_as_fields': '',
+    'influx_max_new_series': 0,
   }
 
   config = default_config.copy()
+  parser = None
 
   # Get config from config.ini first
   if config_path:
@@ -164,39 +575,95 @@ def get_config(config_path=None):
 
   # Special handling depending ontype
   for param in config:
-    # If the default value is a boolean, but we have a string, convert it
-    if isinstance(default_config[param], bool) and isinstance(config[param], str):
-      config[param] = str_to_bool(string=config[param], name=param)
-
-    # If the default value is an int, but we have a string, convert it
-    if isinstance(default_config[param], int) and isinstance(config[param], str):
-      config[param] = int(config[param])
+    config[param] = convert_config_value(param, config[param], default_config[param])
+
+  # Any [section] after the main settings defines a modem, named after the section.
+  # Its settings override the main ones, so only modem_* options usually need to be set.
+  # Without sections, the main settings describe a single unnamed modem.
+  config['modems'] = {}
+  for section in parser.sections() if parser else []:
+    if section == 'MAIN':
+      continue
+    modem_config = config.copy()
+    del modem_config['modems']
+    for param in default_config:
+      if param in parser[section]:
+        modem_config[param] = convert_config_value(param, parser[section][param], default_config[param])
+    modem_config['modem_name'] = section
+    config['modems'][section] = modem_config
 
-    # Finally any 'None' string should just be None
-    if default_config[param] is None and config[param] == 'None':
-      config[param] = None
+  if not config['modems']:
+    modem_config = config.copy()
+    del modem_config['modems']
+    modem_config['modem_name'] = None
+    config['modems'][config['modem_ip']] = modem_config
 
   return config
 
-def send_to_influx(stats, config):
-  """ Send the stats to InfluxDB """
-  logging.info('Sending stats to InfluxDB (%s)', config['influx_url'])
+def convert_config_value(param, value, default):
+  """ Convert a config value to the type of its default """
+  # If the default value is a boolean, but we have a string, convert it
+  if isinstance(default, bool) and isinstance(value, str):
+    return str_to_bool(string=value, name=param)
+
+  # If the default value is an int, but we have a string, convert it
+  if isinstance(default, int) and isinstance(value, str):
+    return int(value)
+
+  # Same for floats
+  if isinstance(default, float) and isinstance(value, str):
+    return float(value)
+
+  # Finally any 'None' string should just be None
+  if default is None and value == 'None':
+    return None
 
-  from influxdb_client import InfluxDBClient, Point
-  from influxdb_client.client.write_api import SYNCHRONOUS
+  return value
 
-  influx_client = InfluxDBClient(
-    url = config['influx_url'],
-    token = config['influx_token'],
-    org = config['influx_org'],
-    verify_ssl = config['influx_verify_ssl']
-  )
-  write_api = influx_client.write_api(write_options = SYNCHRONOUS)
+def get_session_config(config):
+  """ Return the config values a modem login session depends on """
+  return {param: value for param, value in config.items() if param == 'request_timeout' or param.startswith('modem_')}
 
-  series = []
-  current_time = datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+def get_writer_config(config):
+  """ Return the config values the writer depends on """
+  return {param: config[param] for param in ('destination', 'influx_url', 'influx_bucket', 'influx_org', 'influx_token', 'influx_verify_ssl')}
 
-  for stats_down in stats['downstream']:
+def init_writer(config):
+  """ Create the client for the destination, reused across intervals """
+  destination = config['destination']
+
+  # Where should we send the results?
+  if destination == 'influxdb':
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
+    influx_client = InfluxDBClient(
+      url = config['influx_url'],
+      token = config['influx_token'],
+      org = config['influx_org'],
+      verify_ssl = config['influx_verify_ssl']
+    )
+    return {
+      'config': get_writer_config(config),
+      'client': influx_client,
+      'write_api': influx_client.write_api(write_options = SYNCHRONOUS),
+    }
+
+  error_exit('Destination %s not supported!  Aborting.' % destination, sleep=False)
+
+def close_writer(writer):
+  """ Release the destination client """
+  try:
+    writer['write_api'].close()
+    writer['client'].close()
+  except Exception:
+    logging.exception('Failed to close destination client')
+
+def get_influx_records(stats, config, current_time, anomalies=()):
+  """ Build the InfluxDB records for the stats """
+  records = []
+
+  for stats_down in stats.get('downstream', []):
     data = {
       'measurement': 'downstream_statistics',
       'time': current_time,
@@ -212,14 +679,21 @@ def send_to_influx(stats, config):
         'modulation': stats_down['modulation']
       }
     }
+    if config['modem_name']:
+      data['tags']['modem'] = config['modem_name']
     ## Only some modems, like the XB8, has the 'unerrored' value
     if 'unerrored' in stats_down:
       data['fields']['unerrored'] = int(stats_down['unerrored'])
 
-    series.append(Point.from_dict(data))
+    # Derived by counter_rates, missing on the first sample and after a counter reset
+    for field in ('unerrored_rate', 'corrected_rate', 'uncorrectables_rate', 'corrected_ratio', 'uncorrectables_ratio'):
+      if field in stats_down:
+        data['fields'][field] = float(stats_down[field])
+
+    records.append(data)
 
-  for stats_up in stats['upstream']:
-    series.append(Point.from_dict({
+  for stats_up in stats.get('upstream', []):
+    data = {
       'measurement': 'upstream_statistics',
       'time': current_time,
       'fields': {
@@ -231,10 +705,56 @@ def send_to_influx(stats, config):
         'channel_id': int(stats_up['channel_id']),
         'channel_type': stats_up['channel_type']
       }
-    }))
+    }
+    if config['modem_name']:
+      data['tags']['modem'] = config['modem_name']
+
+    records.append(data)
+
+  if stats.get('info'):
+    data = {
+      'measurement': 'modem_info',
+      'time': current_time,
+      'fields': dict(stats['info']),
+      'tags': {}
+    }
+    if config['modem_name']:
+      data['tags']['modem'] = config['modem_name']
+
+    records.append(data)
+
+  for anomaly in anomalies:
+    data = {
+      'measurement': 'channel_anomalies',
+      'time': current_time,
+      'fields': {
+        'value': float(anomaly['value']),
+        'mean': float(anomaly['mean']),
+        'stddev': float(anomaly['stddev']),
+      },
+      'tags': {
+        'direction': anomaly['direction'],
+        'channel_id': int(anomaly['channel_id']),
+        'metric': anomaly['metric']
+      }
+    }
+    if config['modem_name']:
+      data['tags']['modem'] = config['modem_name']
+
+    records.append(data)
+
+  return records
+
+def send_to_influx(records, writer):
+  """ Send the records to InfluxDB """
+  logging.info('Sending stats to InfluxDB (%s)', writer['config']['influx_url'])
+
+  from influxdb_client import Point
+
+  series = [Point.from_dict(record) for record in records]
 
   try:
-    write_api.write(bucket = config['influx_bucket'], record = series)
+    writer['write_api'].write(bucket = writer['config']['influx_bucket'], record = series)
   except Exception:
     logging.exception('Failed To Write To InfluxDB')
     return
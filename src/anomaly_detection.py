@@ -0,0 +1,93 @@
+"""
+  Streaming per-channel anomaly detection
+
+  Keeps an exponentially weighted mean and variance for each channel's SNR,
+  power and codeword error rates (from counter_rates), updated from every
+  parsed sample. A sample further than anomaly_threshold standard deviations
+  from the mean marks the channel as anomalous. Memory is constant per channel and the database is
+  never queried.
+"""
+# pylint: disable=line-too-long
+
+import math
+import logging
+
+# Metrics tracked per direction, with the smallest deviation worth reporting.
+# This keeps perfectly stable channels (variance ~0) from flagging on rounding noise.
+METRICS = {
+  'downstream': {
+    'snr': 1.0,
+    'power': 1.0,
+    'corrected_rate': 1.0,
+    'uncorrectables_rate': 0.1,
+  },
+  'upstream': {
+    'power': 1.0,
+  },
+}
+
+def update(state, stats, config):
+  """ Update the rolling statistics of every channel in stats.
+    state is a dict owned by the caller, kept between calls for the same modem.
+    Returns a list of anomaly events for channels that just went out of bounds.
+  """
+  events = []
+
+  for direction, metrics in METRICS.items():
+    for channel in stats[direction]:
+      key = (direction, channel['channel_id'])
+      channel_state = state.setdefault(key, {})
+
+      for metric, min_deviation in metrics.items():
+        # Rates are missing on the first sample and after a counter reset
+        if metric not in channel:
+          continue
+
+        value = float(channel[metric])
+        event = update_metric(channel_state, metric, value, min_deviation, config)
+        if event:
+          event['direction'] = direction
+          event['channel_id'] = channel['channel_id']
+          logging.warning('Anomaly on %s channel %s: %s is %s (mean %.2f, stddev %.2f)',
+            direction, channel['channel_id'], metric, value, event['mean'], event['stddev'])
+          events.append(event)
+
+  return events
+
+def update_metric(metrics, metric, value, min_deviation, config):
+  """ Check a sample against the rolling mean and variance, then fold it in.
+    Returns an event if the metric just went out of bounds.
+  """
+  alpha = config['anomaly_alpha']
+  rolling = metrics.get(metric)
+  if rolling is None:
+    metrics[metric] = {'mean': value, 'variance': 0.0, 'count': 1, 'anomalous': False}
+    return None
+
+  mean = rolling['mean']
+  stddev = math.sqrt(rolling['variance'])
+  deviation = abs(value - mean)
+  out_of_bounds = (
+    rolling['count'] >= config['anomaly_warmup']
+    and deviation >= min_deviation
+    and deviation > config['anomaly_threshold'] * stddev
+  )
+
+  event = None
+  if out_of_bounds and not rolling['anomalous']:
+    event = {
+      'metric': metric,
+      'value': value,
+      'mean': mean,
+      'stddev': stddev,
+    }
+  rolling['anomalous'] = out_of_bounds
+
+  # Incremental EWMA mean and variance
+  diff = value - mean
+  increment = alpha * diff
+  rolling['mean'] = mean + increment
+  rolling['variance'] = (1 - alpha) * (rolling['variance'] + diff * increment)
+  rolling['count'] += 1
+
+  return event
@@ -6,6 +6,7 @@ import time
 import hmac
 import logging
 import requests
+import cycle_deadline
 
 def get_credential(config):
   """ Get the cookie credential by sending the
@@ -47,7 +48,7 @@ def get_credential(config):
       json=payload,
       headers=headers,
       verify=verify_ssl,
-      timeout=config['request_timeout']
+      timeout=cycle_deadline.get_timeout(config)
     )
 
     if resp.status_code != 200:
@@ -86,7 +87,7 @@ def get_credential(config):
       json=payload,
       headers=headers,
       verify=verify_ssl,
-      timeout=config['request_timeout']
+      timeout=cycle_deadline.get_timeout(config)
     )
 
     if resp.status_code != 200:
@@ -113,13 +114,20 @@ def get_credential(config):
 
 
 def get_json(config, credential):
-  """ Get the status page from the modem
-    return the raw html
+  """ Get the channel status from the modem
+    return the json response
+  """
+  return get_page(config, credential, 'HNAP1')
+
+
+def get_page(config, credential, page):
+  """ Get the channel status from the modem's HNAP page
+    return the json response
   """
 
   ip = config['modem_ip']
   verify_ssl = config['modem_verify_ssl']
-  url = "https://{}/HNAP1/".format(ip)
+  url = "https://{}/{}/".format(ip, page)
 
   soap_action = '"http://purenetworks.com/HNAP1/GetMultipleHNAPs"'
   headers = {
@@ -147,7 +155,7 @@ def get_json(config, credential):
       json=payload,
       headers=headers,
       verify=verify_ssl,
-      timeout=config['request_timeout']
+      timeout=cycle_deadline.get_timeout(config)
     )
     if resp.status_code != 200:
       logging.error('Error retreiving json from %s', url)
@@ -227,6 +235,12 @@ def parse_json(json):
 
   return stats
 
+# Pages fetched each cycle, the first is the channel stats page.
+# interval is the minimum seconds between fetches, 0 for every cycle.
+PAGES = {
+  'HNAP1': { 'interval': 0, 'parse': parse_json },
+}
+
 # Taken from https://github.com/t-mart/ispee/blob/master/src/ispee/s33.py
 def arris_hmac(key: bytes, msg: bytes) -> str:
   """HMAC a message with a key in the way the arris s33 does it."""
@@ -6,7 +6,13 @@
 import base64
 import logging
 import requests
+import cycle_deadline
 from bs4 import BeautifulSoup
+import page_layout
+import modem_info
+
+# Page layouts learned from previous full parses, see page_layout.py
+LAYOUTS = []
 
 def get_credential(config):
   """ Get the cookie credential by sending the
@@ -46,7 +52,7 @@ def get_credential(config):
         auth_url,
         headers={'Authorization': 'Basic ' + auth_hash},
         verify=verify_ssl,
-        timeout=config['request_timeout']
+        timeout=cycle_deadline.get_timeout(config)
       )
       cookie = resp.cookies['sessionId']
       logging.debug('cookie: %s', cookie)
@@ -55,7 +61,7 @@ def get_credential(config):
         auth_url,
         auth=(username, password),
         verify=verify_ssl,
-        timeout=config['request_timeout']
+        timeout=cycle_deadline.get_timeout(config)
       )
       cookie = None
 
@@ -84,11 +90,18 @@ def get_html(config, credential):
   """ Get the status page from the modem
     return the raw html
   """
+  return get_page(config, credential, 'cmconnectionstatus.html')
+
+
+def get_page(config, credential, page):
+  """ Get a page from the modem
+    return the raw html
+  """
 
   if config["modem_ssl"]:
-    init_url = f"https://{config['modem_ip']}/cmconnectionstatus.html"
+    init_url = f"https://{config['modem_ip']}/{page}"
   else:
-    init_url = f"http://{config['modem_ip']}/cmconnectionstatus.html"
+    init_url = f"http://{config['modem_ip']}/{page}"
 
   if config['modem_auth_required'] and config['modem_new_auth']:
     url = init_url + '?ct_' + credential['token']
@@ -106,14 +119,14 @@ def get_html(config, credential):
   else:
     cookies = None
 
-  logging.info('Retreiving stats from %s', init_url)
+  logging.info('Retreiving %s from %s', page, init_url)
 
   try:
     resp = requests.get(
       url,
       cookies=cookies,
       verify=verify_ssl,
-      timeout=config['request_timeout']
+      timeout=cycle_deadline.get_timeout(config)
     )
     if resp.status_code != 200:
       logging.error('Error retreiving html from %s', url)
@@ -140,37 +153,29 @@ def parse_html(html):
   """ Parse the HTML into the modem stats dict """
   logging.info('Parsing HTML for modem model sb8200')
 
-  # As of Aug 2019 the SB8200 has a bug in its HTML
-  # The tables have an extra </tr> in the table headers, we have to remove it so
-  # that Beautiful Soup can parse it
-  # Before: <tr><th colspan=7><strong>Upstream Bonded Channels</strong></th></tr>
-  # After: <tr><th colspan=7><strong>Upstream Bonded Channels</strong></th>
-  html = html.replace('Bonded Channels</strong></th></tr>', 'Bonded Channels</strong></th>', 2)
+  tables = page_layout.read_layout(html, LAYOUTS)
+  if tables:
+    logging.debug('Parsed HTML using learned page layout')
+    downstream_rows, upstream_rows = tables
+  else:
+    downstream_rows, upstream_rows = parse_tables(html)
+    if page_layout.learn_layout(html, [(1, downstream_rows, 0), (2, upstream_rows, 1)], LAYOUTS):
+      logging.debug('Learned page layout, %s known', len(LAYOUTS))
 
-  soup = BeautifulSoup(html, 'html.parser')
   stats = {}
 
   # downstream table
   stats['downstream'] = []
-  for table_row in soup.find_all("table")[1].find_all("tr"):
-    if table_row.th:
-      continue
-
-    channel_id = table_row.find_all('td')[0].text.strip()
-
-    # Some firmwares have a header row not already skiped by "if table_row.th", skip it if channel_id isn't an integer
-    if not channel_id.isdigit():
-      continue
-
-    modulation = table_row.find_all('td')[2].text.replace("Other", "OFDM PLC").strip()
-    frequency = table_row.find_all('td')[3].text.replace(" Hz", "").strip()
-    power = table_row.find_all('td')[4].text.replace(" dBmV", "").strip()
-    snr = table_row.find_all('td')[5].text.replace(" dB", "").strip()
-    corrected = table_row.find_all('td')[6].text.strip()
-    uncorrectables = table_row.find_all('td')[7].text.strip()
+  for cells in downstream_rows:
+    modulation = cells[2].replace("Other", "OFDM PLC").strip()
+    frequency = cells[3].replace(" Hz", "").strip()
+    power = cells[4].replace(" dBmV", "").strip()
+    snr = cells[5].replace(" dB", "").strip()
+    corrected = cells[6]
+    uncorrectables = cells[7]
 
     stats['downstream'].append({
-      'channel_id': channel_id,
+      'channel_id': cells[0],
       'modulation': modulation,
       'frequency': frequency,
       'power': power,
@@ -185,22 +190,14 @@ def parse_html(html):
 
   # upstream table
   stats['upstream'] = []
-  for table_row in soup.find_all("table")[2].find_all("tr"):
-    if table_row.th:
-      continue
-
-    # Some firmwares have a header row not already skiped by "if table_row.th", skip it if channel_id isn't an integer
-    if not channel_id.isdigit():
-      continue
-
-    channel_id = table_row.find_all('td')[1].text.strip()
-    channel_type = table_row.find_all('td')[3].text.replace(" Upstream", "").replace("OFDM", "OFDMA").strip()
-    frequency = table_row.find_all('td')[4].text.replace(" Hz", "").strip()
-    width = table_row.find_all('td')[5].text.replace(" Hz", "").strip()
-    power = table_row.find_all('td')[6].text.replace(" dBmV", "").strip()
+  for cells in upstream_rows:
+    channel_type = cells[3].replace(" Upstream", "").replace("OFDM", "OFDMA").strip()
+    frequency = cells[4].replace(" Hz", "").strip()
+    width = cells[5].replace(" Hz", "").strip()
+    power = cells[6].replace(" dBmV", "").strip()
 
     stats['upstream'].append({
-      'channel_id': channel_id,
+      'channel_id': cells[1],
       'channel_type': channel_type,
       'frequency': frequency,
       'width': width,
@@ -212,3 +209,77 @@ def parse_html(html):
     logging.error('Failed to get any upstream stats! Probably a parsing issue in parse_html()')
 
   return stats
+
+
+def parse_swinfo_html(html):
+  """ Parse the software info page into the modem info dict """
+  logging.info('Parsing software info HTML for modem model sb8200')
+
+  soup = BeautifulSoup(html, 'html.parser')
+  labels = {}
+  for table_row in soup.find_all("tr"):
+    cells = table_row.find_all('td')
+    if len(cells) == 2:
+      labels[cells[0].text.strip()] = cells[1].text.strip()
+  soup.decompose()
+
+  info = modem_info.get_info(labels)
+  logging.debug('info: %s', info)
+  if not info:
+    logging.error('Failed to get any modem info! Probably a parsing issue in parse_swinfo_html()')
+
+  return { 'info': info }
+
+
+def parse_tables(html):
+  """ Full parse of the status page, returns the downstream and upstream
+    data rows as lists of stripped cell text
+  """
+  # As of Aug 2019 the SB8200 has a bug in its HTML
+  # The tables have an extra </tr> in the table headers, we have to remove it so
+  # that Beautiful Soup can parse it
+  # Before: <tr><th colspan=7><strong>Upstream Bonded Channels</strong></th></tr>
+  # After: <tr><th colspan=7><strong>Upstream Bonded Channels</strong></th>
+  html = html.replace('Bonded Channels</strong></th></tr>', 'Bonded Channels</strong></th>', 2)
+
+  soup = BeautifulSoup(html, 'html.parser')
+  tables = soup.find_all("table")
+
+  downstream_rows = []
+  for table_row in tables[1].find_all("tr"):
+    if table_row.th:
+      continue
+
+    cells = [cell.text.strip() for cell in table_row.find_all('td')]
+
+    # Some firmwares have a header row not already skiped by "if table_row.th", skip it if channel_id isn't an integer
+    if not cells[0].isdigit():
+      continue
+
+    downstream_rows.append(cells)
+
+  upstream_rows = []
+  for table_row in tables[2].find_all("tr"):
+    if table_row.th:
+      continue
+
+    cells = [cell.text.strip() for cell in table_row.find_all('td')]
+
+    # Some firmwares have a header row not already skiped by "if table_row.th", skip it if channel_id isn't an integer
+    if not cells[1].isdigit():
+      continue
+
+    upstream_rows.append(cells)
+
+  # Break the tree's reference cycles now rather than waiting for the garbage collector
+  soup.decompose()
+
+  return downstream_rows, upstream_rows
+
+
+# Pages fetched each cycle, the first is the channel stats page.
+# interval is the minimum seconds between fetches, 0 for every cycle.
+PAGES = {
+  'cmconnectionstatus.html': { 'interval': 0, 'parse': parse_html },
+  'cmswinfo.html': { 'interval': 3600, 'parse': parse_swinfo_html },
+}
@@ -0,0 +1,100 @@
+"""
+  Capture raw modem responses to rotating, compressed segment files
+
+  Each modem writes JSON lines of { time, modem, model, page, data } to gzip
+  segments named <modem>-<start time>.jsonl.gz in capture_dir. A new segment
+  is started every capture_rotate_seconds, and the oldest segments beyond
+  capture_max_segments are deleted. Segments can be replayed through the
+  current parser with --replay.
+"""
+# pylint: disable=line-too-long
+
+import os
+import re
+import gzip
+import json
+import time
+import logging
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+
+def write(state, config, name, page, data):
+  """ Append a raw modem response for a page to the modem's current segment.
+    state is a dict owned by the caller, kept between calls for the same modem.
+  """
+  now = time.time()
+
+  if state.get('file') and (state['dir'] != config['capture_dir'] or now - state['opened'] >= config['capture_rotate_seconds']):
+    close(state)
+
+  try:
+    if not state.get('file'):
+      open_segment(state, config, name, now)
+
+    record = {
+      'time': now,
+      'modem': config['modem_name'],
+      'model': config['modem_model'],
+      'page': page,
+      'data': data,
+    }
+    state['file'].write((json.dumps(record) + '\n').encode('utf-8'))
+    # Sync flush so everything written so far can be read back if we're killed
+    state['file'].flush()
+  except Exception:
+    logging.exception('Failed to capture modem response to %s', config['capture_dir'])
+    close(state)
+
+def open_segment(state, config, name, now):
+  """ Start a new segment file, then prune old ones """
+  capture_dir = config['capture_dir']
+  os.makedirs(capture_dir, exist_ok=True)
+
+  prefix = re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '-'
+  path = os.path.join(capture_dir, prefix + time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now)) + SEGMENT_SUFFIX)
+  logging.info('Capturing modem responses to %s', path)
+
+  state['file'] = gzip.open(path, 'ab')
+  state['dir'] = capture_dir
+  state['opened'] = now
+
+  if config['capture_max_segments']:
+    segments = sorted(
+      filename for filename in os.listdir(capture_dir)
+      if filename.startswith(prefix) and filename.endswith(SEGMENT_SUFFIX)
+    )
+    for filename in segments[:-config['capture_max_segments']]:
+      logging.info('Removing old capture segment %s', filename)
+      os.remove(os.path.join(capture_dir, filename))
+
+def close(state):
+  """ Close the modem's current segment """
+  if state.get('file'):
+    try:
+      state['file'].close()
+    except Exception:
+      logging.exception('Failed to close capture segment')
+  state.clear()
+
+def find_segments(paths):
+  """ Expand files and directories into a sorted list of segment files """
+  segments = []
+  for path in paths:
+    if os.path.isdir(path):
+      segments.extend(os.path.join(path, filename) for filename in os.listdir(path) if filename.endswith(SEGMENT_SUFFIX))
+    else:
+      segments.append(path)
+
+  return sorted(segments)
+
+def read_segment(path):
+  """ Yield the captured records in a segment file.
+    A segment that wasn't closed cleanly is read up to its last complete record.
+  """
+  with gzip.open(path, 'rb') as f:
+    try:
+      for line in f:
+        if line.endswith(b'\n'):
+          yield json.loads(line)
+    except EOFError:
+      logging.warning('Capture segment %s was not closed cleanly, replayed up to the last complete record', path)
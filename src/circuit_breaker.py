@@ -0,0 +1,69 @@
+"""
+  Per-modem circuit breaker
+
+  After breaker_failure_threshold failed polls in a row the circuit opens and
+  the modem is skipped without any requests until a backoff expires. The
+  backoff doubles every time the circuit re-opens, up to breaker_backoff_max,
+  with jitter so a fleet of modems that failed together doesn't retry
+  together. The backoff is never shorter than two sleep_intervals, so an open
+  circuit always skips at least one poll. Once the backoff expires a single half-open poll is let through:
+  success closes the circuit, failure opens it again.
+"""
+# pylint: disable=line-too-long
+
+import random
+import logging
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+def new():
+  """ Return the state of a closed breaker """
+  return {'state': CLOSED, 'failures': 0, 'opens': 0, 'retry_at': 0}
+
+def allow(breaker, now):
+  """ Return True if the modem may be polled now """
+  if breaker['state'] == OPEN and now >= breaker['retry_at']:
+    logging.info('Circuit half-open, trying the modem again')
+    breaker['state'] = HALF_OPEN
+
+  return breaker['state'] != OPEN
+
+def success(breaker):
+  """ Record a successful poll """
+  if breaker['state'] != CLOSED:
+    logging.info('Circuit closed, modem recovered')
+  breaker.update(new())
+
+def failure(breaker, config, now):
+  """ Record a failed poll, opening the circuit if needed """
+  breaker['failures'] += 1
+
+  if breaker['state'] == HALF_OPEN or breaker['failures'] >= config['breaker_failure_threshold']:
+    backoff = min(config['breaker_backoff_max'], config['breaker_backoff_base'] * 2 ** breaker['opens'])
+    # Equal jitter, wait between half and all of the backoff
+    backoff = backoff / 2 + random.uniform(0, backoff / 2)
+    # Anything up to a single interval would be over by the next poll anyway
+    backoff = max(backoff, 2 * config['sleep_interval'])
+    breaker['state'] = OPEN
+    breaker['opens'] += 1
+    breaker['retry_at'] = now + backoff
+    logging.warning('Circuit open after %s failed polls, not polling the modem for %.0fs', breaker['failures'], backoff)
+
+def get_record(breaker, config, now, current_time):
+  """ Build the InfluxDB record reporting the breaker state """
+  record = {
+    'measurement': 'modem_circuit_breaker',
+    'time': current_time,
+    'fields': {
+      'state': breaker['state'],
+      'consecutive_failures': breaker['failures'],
+      'retry_in': float(max(0, breaker['retry_at'] - now)) if breaker['state'] == OPEN else 0.0,
+    },
+    'tags': {}
+  }
+  if config['modem_name']:
+    record['tags']['modem'] = config['modem_name']
+
+  return record
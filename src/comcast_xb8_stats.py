@@ -5,7 +5,13 @@
 
 import logging
 import requests
+import cycle_deadline
 from bs4 import BeautifulSoup
+import page_layout
+import modem_info
+
+# Page layouts learned from previous full parses, see page_layout.py
+LAYOUTS = []
 
 def get_credential(config):
   """ Get the cookie credential by posting the
@@ -28,7 +34,7 @@ def get_credential(config):
       url,
       data=data,
       allow_redirects=False,
-      timeout=config['request_timeout']
+      timeout=cycle_deadline.get_timeout(config)
     )
     cookies = resp.cookies
 
@@ -51,13 +57,19 @@ def get_html(config, cookies):
   """ Get the status page from the modem
     return the raw html
   """
+  return get_page(config, cookies, 'network_setup.jst')
+
+def get_page(config, cookies, page):
+  """ Get a page from the modem
+    return the raw html
+  """
 
-  url = f"http://{config['modem_ip']}/network_setup.jst"
+  url = f"http://{config['modem_ip']}/{page}"
 
-  logging.info('Retreiving stats from %s', url)
+  logging.info('Retreiving %s from %s', page, url)
 
   try:
-    resp = requests.get(url, cookies=cookies, timeout=config['request_timeout'])
+    resp = requests.get(url, cookies=cookies, timeout=cycle_deadline.get_timeout(config))
     if resp.status_code != 200:
       logging.error('Error retreiving html from %s', url)
       logging.error('Status code: %s', resp.status_code)
@@ -78,24 +90,31 @@ def parse_html(html):
   """ Parse the HTML into the modem stats dict """
   logging.info('Parsing HTML for modem model xb8')
 
-  soup = BeautifulSoup(html, 'html.parser')
+  tables = page_layout.read_layout(html, LAYOUTS)
+  if tables:
+    logging.debug('Parsed HTML using learned page layout')
+    downstream_rows, upstream_rows, codeword_rows = tables
+  else:
+    downstream_rows, upstream_rows, codeword_rows = parse_tables(html)
+    if page_layout.learn_layout(html, [(0, downstream_rows, None), (1, upstream_rows, None), (2, codeword_rows, None)], LAYOUTS):
+      logging.debug('Learned page layout, %s known', len(LAYOUTS))
+
   stats = {}
 
   # downstream table
-  downstream_rows = soup.find_all("table")[0].find('tbody').find_all("tr")
   # Get count of downstream columns
-  downstream_channels = len(downstream_rows[0].find_all("td"))
+  downstream_channels = len(downstream_rows[0])
   stats['downstream'] = {}
   for i in range(downstream_channels):
-    channel_id = downstream_rows[0].find_all("td")[i].text.strip()
+    channel_id = downstream_rows[0][i]
     channel = {
       'channel_id': channel_id,
-      'snr': downstream_rows[3].find_all("td")[i].text.replace(" dB", "").strip(),
-      'power': downstream_rows[4].find_all("td")[i].text.replace(" dBmV", "").strip(),
+      'snr': downstream_rows[3][i].replace(" dB", "").strip(),
+      'power': downstream_rows[4][i].replace(" dBmV", "").strip(),
     }
 
     # Modulation naming is a bit different for the xb8 than arris
-    modulation = downstream_rows[5].find_all("td")[i].text.strip()
+    modulation = downstream_rows[5][i]
     if modulation == "OFDM":
       channel['modulation'] = "OFDM PLC"
     elif modulation == "256 QAM":
@@ -103,7 +122,7 @@ def parse_html(html):
     else:
       channel['modulation'] = modulation
 
-    frequency = downstream_rows[2].find_all("td")[i].text.strip()
+    frequency = downstream_rows[2][i]
     if "MHz" in frequency:
       channel['frequency'] = frequency.replace(" MHz", "") + '000000'
     else:
@@ -115,15 +134,13 @@ def parse_html(html):
     logging.error('Failed to get any downstream stats! Probably a parsing issue in parse_html()')
 
   # Parse Downstream Codeword stats table
-  codeword_rows = soup.find_all("table")[2].find('tbody').find_all("tr")
-  for i, element in enumerate(codeword_rows[0].find_all("td")):
-     channel_id = element.text.strip()
+  for i, channel_id in enumerate(codeword_rows[0]):
      # NOTE: Indexing by channel_id is important as this table might be ordered
      #       differently than the "Channel Bonding" table parsed above.
      channel = stats['downstream'][channel_id]
-     channel['unerrored'] = codeword_rows[1].find_all("td")[i].text.strip()
-     channel['corrected'] = codeword_rows[2].find_all("td")[i].text.strip()
-     channel['uncorrectables'] = codeword_rows[3].find_all("td")[i].text.strip()
+     channel['unerrored'] = codeword_rows[1][i]
+     channel['corrected'] = codeword_rows[2][i]
+     channel['uncorrectables'] = codeword_rows[3][i]
 
   logging.debug('downstream stats: %s', stats['downstream'])
 
@@ -131,21 +148,20 @@ def parse_html(html):
   stats['downstream'] = stats['downstream'].values()
 
   # Upstream table
-  upstream_rows = soup.find_all("table")[1].find('tbody').find_all("tr")
   # Get count of upstream columns
-  upstream_channels = len(upstream_rows[0].find_all("td"))
+  upstream_channels = len(upstream_rows[0])
   stats['upstream'] = []
   for i in range(upstream_channels):
     channel = {
-      'channel_id': upstream_rows[0].find_all("td")[i].text.strip(),
-      'frequency': upstream_rows[2].find_all("td")[i].text.replace(" MHz", "").strip() + '000000',
+      'channel_id': upstream_rows[0][i],
+      'frequency': upstream_rows[2][i].replace(" MHz", "").strip() + '000000',
       # This symbol rate, not width. In ksym/sec rather than MHz.
-      'width': upstream_rows[3].find_all("td")[i].text.strip(),
-      'power': upstream_rows[4].find_all("td")[i].text.replace(" dBmV", "").strip(),
+      'width': upstream_rows[3][i],
+      'power': upstream_rows[4][i].replace(" dBmV", "").strip(),
     }
 
     # Modulation naming is a bit different for the xb8 than arris
-    channel_type = upstream_rows[5].find_all("td")[i].text.strip() + '-' + upstream_rows[6].find_all("td")[i].text.strip()
+    channel_type = upstream_rows[5][i] + '-' + upstream_rows[6][i]
     if channel_type == "OFDMA-TDMA":
       channel['channel_type'] = "OFDMA"
     elif channel_type == "QAM-ATDMA":
@@ -160,3 +176,52 @@ def parse_html(html):
     logging.error('Failed to get any upstream stats! Probably a parsing issue in parse_html()')
 
   return stats
+
+
+def parse_at_a_glance_html(html):
+  """ Parse the at a glance page into the modem info dict """
+  logging.info('Parsing at a glance HTML for modem model xb8')
+
+  soup = BeautifulSoup(html, 'html.parser')
+  labels = {}
+  # Values are laid out as <span class="readonly-label">Label:</span><span class="value">Value</span>
+  for label in soup.find_all("span", class_="readonly-label"):
+    value = label.find_next_sibling("span", class_="value")
+    if value:
+      labels[label.text.strip()] = value.text.strip()
+  soup.decompose()
+
+  info = modem_info.get_info(labels)
+  logging.debug('info: %s', info)
+  if not info:
+    logging.error('Failed to get any modem info! Probably a parsing issue in parse_at_a_glance_html()')
+
+  return { 'info': info }
+
+
+def parse_tables(html):
+  """ Full parse of the network setup page, returns the rows of the downstream,
+    upstream and codeword tables as lists of stripped cell text
+  """
+  soup = BeautifulSoup(html, 'html.parser')
+  tables = soup.find_all("table")
+
+  rows = []
+  for table in tables[:3]:
+    rows.append([
+      [cell.text.strip() for cell in table_row.find_all("td")]
+      for table_row in table.find('tbody').find_all("tr")
+    ])
+
+  # Break the tree's reference cycles now rather than waiting for the garbage collector
+  soup.decompose()
+
+  return rows
+
+
+# Pages fetched each cycle, the first is the channel stats page.
+# interval is the minimum seconds between fetches, 0 for every cycle.
+PAGES = {
+  'network_setup.jst': { 'interval': 0, 'parse': parse_html },
+  'at_a_glance.jst': { 'interval': 3600, 'parse': parse_at_a_glance_html },
+}
@@ -0,0 +1,73 @@
+"""
+  Per-channel codeword error rates
+
+  The modems only report cumulative codeword counters, which reset when the
+  modem reboots and wrap around on firmwares with 32-bit counters. This keeps
+  the previous sample of each downstream channel's counters and adds the
+  per-second rates (and, when the modem reports unerrored codewords, the
+  error ratios) to the channel's stats, so dashboards don't need derivative
+  queries.
+"""
+# pylint: disable=line-too-long
+
+import logging
+
+COUNTERS = ('unerrored', 'corrected', 'uncorrectables')
+
+COUNTER_WRAP = 2 ** 32
+
+# Codewords per second no single channel comes near, a 256-QAM SC-QAM channel
+# carries about 50k and a full OFDM channel about 120k. A drop that would need
+# more than this to be a wrap is a reset.
+MAX_CODEWORD_RATE = 1000000
+
+def update(state, stats, now):
+  """ Add <counter>_rate, and corrected_ratio/uncorrectables_ratio if possible,
+    to each downstream channel in stats.
+    state is a dict owned by the caller, kept between calls for the same modem.
+  """
+  for channel in stats.get('downstream', []):
+    previous = state.get(channel['channel_id'])
+    current = {counter: int(channel[counter]) for counter in COUNTERS if counter in channel}
+    state[channel['channel_id']] = (current, now)
+
+    if not previous:
+      continue
+
+    previous_counters, previous_time = previous
+    elapsed = now - previous_time
+    if elapsed <= 0:
+      continue
+
+    deltas = {}
+    for counter, value in current.items():
+      if counter not in previous_counters:
+        continue
+      delta = get_delta(previous_counters[counter], value, elapsed)
+      if delta is None:
+        logging.info('%s counter on channel %s went from %s to %s, modem probably rebooted',
+          counter, channel['channel_id'], previous_counters[counter], value)
+        continue
+      deltas[counter] = delta
+      channel[counter + '_rate'] = delta / elapsed
+
+    if len(deltas) == len(COUNTERS):
+      total = sum(deltas.values())
+      if total:
+        channel['corrected_ratio'] = deltas['corrected'] / total
+        channel['uncorrectables_ratio'] = deltas['uncorrectables'] / total
+
+def get_delta(previous, current, elapsed):
+  """ Return how much a counter grew in elapsed seconds, or None if it was reset """
+  if current >= previous:
+    return current - previous
+
+  # A counter that was in the top half of the 32-bit range and dropped may have
+  # wrapped, if it could have counted that far since the previous sample.
+  # Anything else going backwards is a reset from a reboot.
+  if COUNTER_WRAP // 2 <= previous < COUNTER_WRAP and current < COUNTER_WRAP // 2:
+    wrapped = current + COUNTER_WRAP - previous
+    if wrapped <= MAX_CODEWORD_RATE * elapsed:
+      return wrapped
+
+  return None
@@ -0,0 +1,42 @@
+"""
+  Whole-cycle deadline for polling a modem
+
+  Each poll gets cycle_deadline seconds for login, fetch and parse. Every
+  request made during the poll gets separate connect and read timeouts,
+  request_connect_timeout and request_timeout, each cut down to whatever is
+  left of the cycle's budget. Once the budget is spent, the next request
+  raises DeadlineExceeded instead of being sent.
+"""
+# pylint: disable=line-too-long
+
+import time
+
+class DeadlineExceeded(Exception):
+  """ The poll ran out of time """
+
+def start(config):
+  """ Return a copy of the modem config carrying this cycle's deadline """
+  if not config['cycle_deadline']:
+    return dict(config, cycle_deadline_at=None)
+
+  return dict(config, cycle_deadline_at=time.monotonic() + config['cycle_deadline'])
+
+def get_timeout(config):
+  """ Return the (connect, read) timeout for the next request of the cycle """
+  connect = config['request_connect_timeout'] or config['request_timeout']
+  read = config['request_timeout']
+
+  deadline_at = config.get('cycle_deadline_at')
+  if deadline_at is None:
+    return (connect, read)
+
+  remaining = deadline_at - time.monotonic()
+  if remaining <= 0:
+    raise DeadlineExceeded('Cycle deadline of %ss exceeded' % config['cycle_deadline'])
+
+  return (min(connect, remaining), min(read, remaining))
+
+def expired(config):
+  """ Return True if the cycle's budget is spent """
+  deadline_at = config.get('cycle_deadline_at')
+  return deadline_at is not None and time.monotonic() >= deadline_at
@@ -0,0 +1,72 @@
+"""
+  Opt-in memory tracing for the long running collector
+
+  When memory_trace_interval is set, tracemalloc is started and every
+  interval the top allocation sites are logged, along with how much each
+  grew since the previous report and the process RSS.
+"""
+# pylint: disable=line-too-long
+
+import os
+import sys
+import time
+import logging
+import resource
+import tracemalloc
+
+def get_rss():
+  """ Return the resident set size in bytes and what it measures, 'RSS' for
+    the current size or 'peak RSS' where only the peak is available
+  """
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'), 'RSS'
+  except (OSError, ValueError, IndexError):
+    # Not Linux, fall back to the peak RSS, which is in bytes on macOS and KiB elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+      maxrss *= 1024
+    return maxrss, 'peak RSS'
+
+def log_top_allocations(state, config):
+  """ Log the top allocation sites if memory_trace_interval has passed.
+    state is a dict owned by the caller, kept between calls.
+  """
+  now = time.monotonic()
+
+  if not tracemalloc.is_tracing():
+    logging.info('Starting memory tracing, reporting every %s seconds', config['memory_trace_interval'])
+    tracemalloc.start()
+    state['last_report'] = now
+    state['snapshot'] = None
+    return
+
+  if now - state['last_report'] < config['memory_trace_interval']:
+    return
+  state['last_report'] = now
+
+  snapshot = tracemalloc.take_snapshot().filter_traces((
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+  ))
+  current, peak = tracemalloc.get_traced_memory()
+  rss, rss_kind = get_rss()
+  logging.info('Memory: %s %.1f MiB, traced %.1f MiB (peak %.1f MiB)',
+    rss_kind, rss / 2**20, current / 2**20, peak / 2**20)
+
+  if state['snapshot']:
+    stats = snapshot.compare_to(state['snapshot'], 'lineno')
+  else:
+    stats = snapshot.statistics('lineno')
+
+  for stat in stats[:config['memory_trace_top']]:
+    logging.info('Memory: %s', stat)
+
+  state['snapshot'] = snapshot
+
+def stop(state):
+  """ Stop memory tracing and drop the saved snapshot """
+  if tracemalloc.is_tracing():
+    logging.info('Stopping memory tracing')
+    tracemalloc.stop()
+  state.clear()
@@ -0,0 +1,49 @@
+"""
+  Modem uptime and software info shared by the HTML parsers
+"""
+# pylint: disable=line-too-long
+
+import re
+
+UPTIME_PARTS = (
+  (re.compile(r'(\d+)\s*d', re.IGNORECASE), 86400),
+  (re.compile(r'(\d+)\s*h', re.IGNORECASE), 3600),
+  (re.compile(r'(\d+)\s*m', re.IGNORECASE), 60),
+  (re.compile(r'(\d+)(?:\.\d+)?\s*s', re.IGNORECASE), 1),
+)
+
+# Labels used across firmwares for the fields we keep, matched case insensitively
+LABELS = {
+  'up time': 'uptime',
+  'system uptime': 'uptime',
+  'software version': 'software_version',
+  'hardware version': 'hardware_version',
+  'hw version': 'hardware_version',
+}
+
+def get_info(labels):
+  """ Turn a dict of page labels and values into the modem info dict """
+  info = {}
+  for label, value in labels.items():
+    field = LABELS.get(label.strip().rstrip(':').lower())
+    if not field or not value:
+      continue
+
+    if field == 'uptime':
+      uptime = parse_uptime(value)
+      if uptime is not None:
+        info['uptime'] = uptime
+    else:
+      info[field] = value
+
+  return info
+
+def parse_uptime(text):
+  """ Parse uptimes like '7 days 02h:13m:56s.00' into seconds """
+  seconds = None
+  for pattern, multiplier in UPTIME_PARTS:
+    match = pattern.search(text)
+    if match:
+      seconds = (seconds or 0) + int(match.group(1)) * multiplier
+
+  return seconds
@@ -0,0 +1,116 @@
+"""
+  Learned page layouts for the HTML parsers
+
+  The first successful full parse of a page records, for each stats table, the
+  markup that leads up to its first data row. Later polls find that marker with
+  a plain string search and read the rows that follow it, skipping BeautifulSoup
+  entirely. If the marker is missing or the rows don't look the same, including
+  a row whose channel id column isn't a number, the caller falls back to the
+  full parse and learns the new layout.
+"""
+# pylint: disable=line-too-long
+
+import re
+import html as html_lib
+
+# Firmware layouts to remember per parser, oldest are dropped first
+MAX_LAYOUTS = 4
+
+TABLE_START = re.compile(r'<table\b', re.IGNORECASE)
+TABLE_END = re.compile(r'</table\s*>', re.IGNORECASE)
+ROW_END = re.compile(r'</tr\s*>', re.IGNORECASE)
+CELL = re.compile(r'<td\b[^>]*>(.*?)</td\s*>', re.IGNORECASE | re.DOTALL)
+MARKUP = re.compile(r'<!--.*?-->|<[^>]*>', re.DOTALL)
+
+def read_layout(html, layouts):
+  """ Read the stats tables using the first learned layout that matches the page.
+    Returns a list of rows per table, or None if no layout matches.
+  """
+  for layout in layouts:
+    tables = []
+    for prefix, columns, id_column in layout:
+      rows = read_table(html, prefix, columns, id_column)
+      if rows is None:
+        break
+      tables.append(rows)
+    else:
+      return tables
+
+  return None
+
+def learn_layout(html, tables, layouts):
+  """ Learn the layout of a page from the rows found by a full parse.
+    tables is a list of (table index, rows, id column) tuples, where rows are
+    lists of stripped cell text and id column is the index of the cell the full
+    parse requires to be a number, or None if it doesn't check. The layout is only kept if reading the page with it
+    gives back exactly the same rows.
+  """
+  layout = []
+  for index, rows, id_column in tables:
+    table = learn_table(html, index, rows, id_column)
+    if not table:
+      return False
+    layout.append(table)
+
+  if layout in layouts:
+    return True
+
+  layouts.append(layout)
+  del layouts[:-MAX_LAYOUTS]
+  return True
+
+def learn_table(html, index, rows, id_column):
+  """ Find the markup leading up to the first data row of the index-th table """
+  if not rows:
+    return None
+
+  starts = [match.start() for match in TABLE_START.finditer(html)]
+  if index >= len(starts):
+    return None
+
+  table_start = starts[index]
+  end_match = TABLE_END.search(html, table_start)
+  table_end = end_match.start() if end_match else len(html)
+
+  # Walk the rows until we reach the one the full parse saw first
+  row_start = table_start
+  for row_end in ROW_END.finditer(html, table_start, table_end):
+    if get_cells(html[row_start:row_end.start()]) == rows[0]:
+      break
+    row_start = row_end.end()
+  else:
+    return None
+
+  table = (html[table_start:row_start], len(rows[0]), id_column)
+  if read_table(html, *table) != rows:
+    return None
+
+  return table
+
+def read_table(html, prefix, columns, id_column):
+  """ Return the rows following prefix, or None if the page doesn't match """
+  start = html.find(prefix)
+  if start == -1:
+    return None
+
+  start += len(prefix)
+  end_match = TABLE_END.search(html, start)
+  end = end_match.start() if end_match else len(html)
+
+  rows = []
+  for segment in ROW_END.split(html[start:end]):
+    cells = get_cells(segment)
+    if not cells:
+      continue
+    if len(cells) != columns:
+      return None
+    # A row the full parse would have skipped, like a totals row
+    if id_column is not None and not cells[id_column].isdigit():
+      return None
+    rows.append(cells)
+
+  return rows or None
+
+def get_cells(segment):
+  """ Return the stripped text of each <td> in a chunk of markup """
+  return [html_lib.unescape(MARKUP.sub('', cell)).strip() for cell in CELL.findall(segment)]
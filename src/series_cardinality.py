@@ -0,0 +1,78 @@
+"""
+  Series cardinality guardrails for the InfluxDB records
+
+  Every distinct measurement and tag set is a series in InfluxDB, and each
+  one costs index memory. Firmware renames or channel re-ranging create new
+  series, so this tracks the series each modem has written, can write
+  configured tags as fields instead, and caps how many new series a modem
+  may create per interval.
+"""
+# pylint: disable=line-too-long
+
+import time
+import logging
+
+# Series not written for this many seconds no longer count as active
+SERIES_TTL = 24 * 60 * 60
+
+def limit(state, records, config, current_time):
+  """ Apply the cardinality rules to one interval of records for a modem.
+    state is a dict owned by the caller, kept between intervals for the same modem.
+    Returns the records to write, including one reporting the modem's cardinality.
+  """
+  now = time.time()
+  series = state.setdefault('series', {})
+  max_new_series = config['influx_max_new_series']
+
+  # The first interval sets the baseline, so it isn't capped
+  capped = max_new_series > 0 and bool(series)
+
+  kept = []
+  new_series = 0
+  dropped = 0
+  for record in move_tags_to_fields(records, config):
+    key = (record['measurement'], tuple(sorted(record['tags'].items())))
+    if key not in series:
+      if capped and new_series >= max_new_series:
+        dropped += 1
+        continue
+      new_series += 1
+
+    series[key] = now
+    kept.append(record)
+
+  for key, last_seen in list(series.items()):
+    if now - last_seen > SERIES_TTL:
+      del series[key]
+
+  if dropped:
+    logging.warning('Dropped %s points that would create more than %s new series this interval, active series: %s',
+      dropped, max_new_series, len(series))
+  elif new_series and capped:
+    logging.info('Created %s new series, active series: %s', new_series, len(series))
+
+  report = {
+    'measurement': 'series_cardinality',
+    'time': current_time,
+    'fields': {
+      'active_series': len(series),
+      'new_series': new_series,
+      'dropped_points': dropped,
+    },
+    'tags': {}
+  }
+  if config['modem_name']:
+    report['tags']['modem'] = config['modem_name']
+  kept.append(report)
+
+  return kept
+
+def move_tags_to_fields(records, config):
+  """ Write the tags listed in influx_tags_as_fields as fields instead """
+  tags_as_fields = [tag.strip() for tag in config['influx_tags_as_fields'].split(',') if tag.strip()]
+  for record in records:
+    for tag in tags_as_fields:
+      if tag in record['tags']:
+        record['fields'][tag] = record['tags'].pop(tag)
+
+  return records
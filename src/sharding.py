@@ -0,0 +1,91 @@
+"""
+  Split a modem fleet across collector instances
+
+  Modems are assigned to instances with rendezvous (highest random weight)
+  hashing: every instance scores each modem against each member and owns the
+  modems it scores highest on. All instances agree without talking to each
+  other, and adding or removing a member only moves the modems it gains or
+  loses, about 1/members of the fleet.
+
+  Members are either fixed (shard_index of shard_count) or discovered from
+  heartbeat files in a shared shard_lock_dir.
+"""
+# pylint: disable=line-too-long
+
+import os
+import time
+import socket
+import hashlib
+import logging
+
+def get_members(state, config):
+  """ Return this instance's member id and the ids of all live members """
+  if not config['shard_lock_dir']:
+    return str(config['shard_index']), [str(index) for index in range(config['shard_count'])]
+
+  # Heartbeat, then collect everyone that has done the same recently
+  heartbeat(state, config)
+
+  lock_dir = config['shard_lock_dir']
+  timeout = config['shard_heartbeat_timeout'] or 3 * config['sleep_interval']
+  now = time.time()
+  members = []
+  for member in os.listdir(lock_dir):
+    try:
+      age = now - os.stat(os.path.join(lock_dir, member)).st_mtime
+      if age <= timeout:
+        members.append(member)
+      elif age > 10 * timeout:
+        # Long dead instance, clean up after it
+        os.remove(os.path.join(lock_dir, member))
+    except FileNotFoundError:
+      continue
+
+  if state['member'] not in members:
+    members.append(state['member'])
+
+  return state['member'], sorted(members)
+
+def heartbeat(state, config):
+  """ Tell the other instances this one is still alive, called before every
+    poll so a long run of slow modems doesn't look like a dead instance
+  """
+  if not config['shard_lock_dir']:
+    return
+
+  lock_dir = config['shard_lock_dir']
+  if 'member' not in state:
+    state['member'] = '%s-%s' % (socket.gethostname(), os.getpid())
+    os.makedirs(lock_dir, exist_ok=True)
+
+  path = os.path.join(lock_dir, state['member'])
+  with open(path, 'a'):
+    os.utime(path)
+
+def leave(state, config):
+  """ Remove this instance's heartbeat so the others take over its modems right away """
+  if config['shard_lock_dir'] and 'member' in state:
+    try:
+      os.remove(os.path.join(config['shard_lock_dir'], state['member']))
+    except FileNotFoundError:
+      pass
+
+def get_owner(modem, members):
+  """ Return the member that owns a modem """
+  return max(members, key=lambda member: hashlib.sha1(('%s/%s' % (member, modem)).encode('utf-8')).digest())
+
+def select_modems(state, config, modems):
+  """ Return the modems owned by this instance, logging when the assignment changes """
+  if not config['shard_lock_dir'] and config['shard_count'] <= 1:
+    return modems
+
+  member, members = get_members(state, config)
+  owned = {name: modem for name, modem in modems.items() if get_owner(name, members) == member}
+
+  assignment = (tuple(members), tuple(owned))
+  if state.get('assignment') != assignment:
+    logging.info('Shard %s of %s members owns %s of %s modems: %s',
+      member, len(members), len(owned), len(modems), ', '.join(owned) or 'none')
+    state['assignment'] = assignment
+
+  return owned